@@ -5,10 +5,13 @@ Insight Data Engineering Coding Challenge
 '''
 
 import os
+import sys
 import argparse
-import datetime
-import math
-import heapq
+from heapq import heappush, heappushpop
+
+OUTPUT_BUFFER_LINES = 4096    # number of output lines buffered before each write
+DAYS_IN_MONTH = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)    # indexed by month, leap year February
+PARSED_YEARS = {}    # key: 4-digit year string; value: year (int). At most 10000 entries
 
 def get_filepaths():
     '''
@@ -45,15 +48,16 @@ def parse_itcont(itcont_raw):
         year (int)
         trans_amount (float)
     '''
-    itcont = itcont_raw.split('|')
+    itcont = itcont_raw.split('|', 16)    # only fields up to OTHER_ID (index 15) are used, so the rest is left unsplit
 
     if itcont[15]:
         raise ValueError('OTHER_ID field contains value')
 
-    cmtd_id = itcont[0]
-    name = itcont[7]
+    # interns repeated strings so dictionary key comparisons can short-circuit on identity
+    cmtd_id = sys.intern(itcont[0])
+    name = sys.intern(itcont[7])
     year = get_year(itcont[13])
-    zip_code = get_zip_code(itcont[10])
+    zip_code = sys.intern(get_zip_code(itcont[10]))
 
     try:
         trans_amount = int(round(float(itcont[14])))
@@ -69,7 +73,7 @@ def parse_itcont(itcont_raw):
 
 def get_zip_code(zip_code):
     '''
-    Verifies if zip code has more than 5 digits and returns the 5-digit zip code
+    Verifies if the first 5 characters of zip code are digits and returns the 5-digit zip code
     Raises ValueError if zip_code is malformed
 
     Parameters:
@@ -78,10 +82,12 @@ def get_zip_code(zip_code):
     Return:
         5-digit zip code (string)
     '''
+    zip_code = zip_code[0:5]    # only the first 5 digits are used, so the rest is not scanned
+
     if (len(zip_code) < 5) or (not zip_code.isdigit()):
         raise ValueError('Invalid zip code')
     else:
-        return zip_code[0:5]
+        return zip_code
 
 def get_year(date):
     '''
@@ -94,126 +100,147 @@ def get_year(date):
     Returns:
         year (int)
     '''
-    try:
-        month = date[0:2]
-        day = date[2:4]
-        year = date[4:8]
-        date = datetime.datetime(year = int(year), month = int(month), day = int(day))
-
-        return date.year
-    except (ValueError, IndexError):
+    if (len(date) < 8) or (not date[0:8].isdigit()):
         raise ValueError('Invalid transaction date')
 
-def update_repeat_donation(percentile, repeat_donation, trans_amount):
-    '''
-    Updates information about contributions received by recipient from the 
-    contributor's zip code streamed in so far in this calendar year
-     and computes donation amount in a given percentile using the nearest-rank method
-
-     Parameters:
-         percentile (float): percentile to compute
-         repeat_donation (dict): { 'total_amount': total amount of contributions from repeat donors (float),
-                                   'num_trans': total number of transactions from repeat donors (int),
-                                   'max_heap': contains the smallest n% of transaction amounts (heapq)
-                                                 i.e.: largest value in max_heap is n-th percentile value
-                                   'min_heap': contains the rest of the transaction amounts (heapq) }
-         trans_amount (float): transaction amount of new contribution from a repeat donor
-
-     Returns:
-         None
-     '''
-    repeat_donation['total_amount'] += trans_amount
-    repeat_donation['num_trans'] += 1
-
-    # computes the ordinal rank of n-th percentile value
-    ordinal_rank = int( math.ceil(percentile/100. * repeat_donation['num_trans'] ) )
-
-    max_heap = repeat_donation['max_heap']
-    min_heap = repeat_donation['min_heap']
-
-    if(trans_amount <= -(max_heap[0])):
-        heapq.heappush(max_heap, -trans_amount)
-    else:
-        heapq.heappush(min_heap, trans_amount)
+    month = int(date[0:2])
+    day = int(date[2:4])
 
-    if(len(max_heap) > ordinal_rank):        # max_heap contains more than n% of elements
-        temp = -heapq.heappop(max_heap)        # removes the largest value in max_heap and adds to min_heap
-        heapq.heappush(min_heap, temp)
+    # looks up the parsed year so every record of a year shares one int object
+    year = PARSED_YEARS.get(date[4:8])
+    if year is None:
+        year = PARSED_YEARS[date[4:8]] = int(date[4:8])
+
+    if (year < 1) or (not 1 <= month <= 12) or (not 1 <= day <= DAYS_IN_MONTH[month]):
+        raise ValueError('Invalid transaction date')
+    if (month == 2) and (day == 29) and not (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)):
+        raise ValueError('Invalid transaction date')    # February 29 of a non-leap year
+
+    return year
 
-    if(len(max_heap) < ordinal_rank):        # max_heap contains fewer than n% of elements
-        temp = heapq.heappop(min_heap)        # removes the smallest value in min_heap and adds to max_heap
-        heapq.heappush(max_heap, -temp)
 
-def get_repeat_donation_stats(repeat_donation):
+class RepeatDonation(object):
     '''
-    Returns repeat donation statistics for output
+    Contributions received by recipient from the contributor's zip code
+    streamed in so far in this calendar year from repeat donors
+
+    Attributes:
+        output_prefix (string): 'CMTE_ID|ZIP_CODE|YEAR' columns of every output line for this record
+        total_amount (int): total amount of contributions from repeat donors
+        num_trans (int): total number of transactions from repeat donors
+        max_heap (heapq): contains the smallest n% of transaction amounts, stored negated
+                          i.e.: largest value in max_heap is n-th percentile value
+        min_heap (heapq): contains the rest of the transaction amounts
+    '''
+    __slots__ = ('output_prefix', 'total_amount', 'num_trans', 'max_heap', 'min_heap')
 
-     Parameters:
-         repeat_donation (dict): { 'total_amount': total amount of contributions from repeat donors (float),
-                                   'num_trans': total number of transactions from repeat donors (int),
-                                   'max_heap': contains the smallest n% of transaction amounts (heapq)
-                                                 i.e.: largest value in max_heap is n-th percentile value
-                                   'min_heap': contains the rest of the transaction amounts (heapq) }
+    def __init__(self, cmtd_id, zip_code, year, trans_amount):
+        self.output_prefix = f'{cmtd_id}|{zip_code}|{year}'    # formatted once per record instead of once per output line
+        self.total_amount = trans_amount
+        self.num_trans = 1
+        self.max_heap = [-trans_amount]    # uses the negative value because heapq only supports min-heap.
+        self.min_heap = []                 # a single-element and an empty list are already valid heaps
 
-     Returns:
-         total contribution amount (int)
-         total number of transactions (int)
-         percentile value (int)
-     '''
-    total_amount = repeat_donation['total_amount']
-    number_of_transactions = repeat_donation['num_trans']
-    percentile_value = -(repeat_donation['max_heap'][0])    # largest value in max_heap is the n-th percentile value
 
-    return total_amount, number_of_transactions, percentile_value
+def main():
+    '''
+    Streams itcont.txt and writes statistics about contributions from repeat donors to repeat_donors.txt
+    Runs inside a function so that names used in the main loop, including the percentile, are fast local lookups
 
+    Parameters:
+        None
 
-if __name__ == "__main__":
+    Returns:
+        None
+    '''
     itcont_filepath, output_filepath, percentile_filepath = get_filepaths()
 
     with open(percentile_filepath) as f:
-        percentile = float(f.readline())
+        percentile = int(f.readline())
 
-    repeat_donors_dict = {}        # key: (name, zip_code); value: year of contribution.
-    repeat_donations_dict = {}        # key: (cmtd_id, zip_code, year); value: contribution info
+    if not 1 <= percentile <= 100:
+        raise ValueError('Percentile must be an integer between 1 and 100')
 
-    with open(itcont_filepath, 'r') as input_file, open(output_filepath, 'w') as output_file:
-        itcont_raw = input_file.readline()
+    repeat_donors_dict = {}        # key: (name, zip_code); value: year of contribution.
+    repeat_donations_dict = {}        # key: (cmtd_id, zip_code, year); value: RepeatDonation
 
-        while(itcont_raw):    # if new line of itcont.txt is not empty
+    out_buf = []        # formatted output lines waiting to be written
 
-            try:
-                cmtd_id, name, zip_code, year, amount = parse_itcont(itcont_raw)
+    # binds frequently used methods to names once, instead of looking them up for every record
+    get_first_year = repeat_donors_dict.get
+    get_repeat_donation = repeat_donations_dict.get
+    buffer_line = out_buf.append
 
-                if (name, zip_code) in repeat_donors_dict:    # this donor is a repeated donor
+    with open(itcont_filepath, 'r', buffering=1<<20) as input_file, open(output_filepath, 'w', buffering=1<<20) as output_file:
 
-                    if year >= repeat_donors_dict[(name, zip_code)]:    # skips the record if transaction date is for a previous calendar year
+        for itcont_raw in input_file:    # iterates itcont.txt line by line with a 1 MiB read buffer
 
-                        if (cmtd_id, zip_code, year) in repeat_donations_dict:
-                            update_repeat_donation(percentile, repeat_donations_dict[(cmtd_id, zip_code, year)], amount)
+            try:
+                cmtd_id, name, zip_code, year, amount = parse_itcont(itcont_raw)
+                donor_key = (name, zip_code)
+
+                first_year = get_first_year(donor_key)
+
+                if first_year is None:
+                    # adds donor to repeat_donors_dict; a dict rather than a set because the first year is needed
+                    # to skip records from a previous calendar year
+                    repeat_donors_dict[donor_key] = year
+
+                elif year >= first_year:    # this donor is a repeated donor; skips the record if transaction date is for a previous calendar year
+
+                    donation_key = (cmtd_id, zip_code, year)
+                    repeat_donation = get_repeat_donation(donation_key)
+
+                    if repeat_donation is not None:
+                        # updates contributions received by recipient from the contributor's zip code in this calendar year
+                        total_amount = repeat_donation.total_amount + amount
+                        number_of_transactions = repeat_donation.num_trans + 1
+                        repeat_donation.total_amount = total_amount
+                        repeat_donation.num_trans = number_of_transactions
+
+                        # computes the ordinal rank of n-th percentile value, i.e. ceil(percentile/100 * num_trans) in integer arithmetic
+                        ordinal_rank = -(-percentile * number_of_transactions // 100)
+
+                        # max_heap contains the smallest n% of transaction amounts, i.e. its largest value is the n-th percentile value
+                        # min_heap contains the rest of the transaction amounts
+                        max_heap = repeat_donation.max_heap
+                        min_heap = repeat_donation.min_heap
+
+                        # inserts the new amount and rebalances the heaps with at most two heap operations
+                        if(amount <= -(max_heap[0])):
+                            if(len(max_heap) < ordinal_rank):        # max_heap needs one more element
+                                heappush(max_heap, -amount)
+                            else:        # adds new amount to max_heap and moves the largest value in max_heap to min_heap
+                                temp = -heappushpop(max_heap, -amount)
+                                heappush(min_heap, temp)
                         else:
-                            # creates a new repeat donation record
-                            max_heap = [-amount]    # uses the negative value because heapq only supports min-heap. 
-                            min_heap = []
-                            heapq.heapify(max_heap)
-                            heapq.heapify(min_heap)
-                            repeat_donations_dict[(cmtd_id, zip_code, year)] = {'max_heap': max_heap, 
-                                                                                'min_heap': min_heap, 
-                                                                                'total_amount':amount, 
-                                                                                'num_trans': 1}
-
-                        total_amount, number_of_transactions, percentile_value \
-                            = get_repeat_donation_stats(repeat_donations_dict[(cmtd_id, zip_code, year)])
-
-                        # Writes to output file
-                        output_file.write('{}|{}|{}|{}|{}|{}\n'.format(cmtd_id, zip_code, year, 
-                                                                        percentile_value, total_amount, number_of_transactions))
-                else:
-                    # adds donor to repeat_donors_dict
-                    repeat_donors_dict[(name, zip_code)] = year
+                            if(len(max_heap) < ordinal_rank):        # adds new amount to min_heap and moves the smallest value in min_heap to max_heap
+                                temp = heappushpop(min_heap, amount)
+                                heappush(max_heap, -temp)
+                            else:
+                                heappush(min_heap, amount)
+
+                        percentile_value = -(max_heap[0])    # largest value in max_heap is the n-th percentile value
+                    else:
+                        # creates a new repeat donation record
+                        repeat_donation = RepeatDonation(cmtd_id, zip_code, year, amount)
+                        repeat_donations_dict[donation_key] = repeat_donation
+
+                        total_amount = amount
+                        number_of_transactions = 1
+                        percentile_value = amount
+
+                    # Buffers output line and writes to output file in chunks
+                    buffer_line(f'{repeat_donation.output_prefix}|{percentile_value}|{total_amount}|{number_of_transactions}\n')
+                    if len(out_buf) >= OUTPUT_BUFFER_LINES:
+                        output_file.write(''.join(out_buf))
+                        out_buf.clear()
 
             except ValueError:    # If record is malformed, ignore and skip the record
                 pass
 
-            itcont_raw = input_file.readline()    # reads new line from itcont.txt
+        output_file.write(''.join(out_buf))    # writes remaining buffered lines
 
 
+if __name__ == "__main__":
+    main()